@@ -7,5 +7,5 @@ You may obtain a copy of the License at http://www.apache.org/licenses/LICENSE-2
 """
 
 MIN_WORD_LENGTH = 4
-MAX_WORD_LENGTH = float('inf')
+MAX_WORD_LENGTH = 2**31 - 1  # No limit, as an int so length checks stay int comparisons
 SEARCH_DEPTH = 4
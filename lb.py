@@ -8,17 +8,40 @@ It uses the NLTK word list as the default dictionary and outputs all possible so
 
 Functions:
     parse_arguments(): Parses command line arguments.
+    set_sides(args, sides): Sets the letters on the sides of the box to solve for.
     spinner(stop_event): Displays a spinner with elapsed time in the console.
     start_spinner(): Starts the spinner.
     stop_spinner(stop_event, spinner_thread): Stops the spinner.
-    get_dictionary(dictionary): Returns a list of words from the specified dictionary.
+    get_dictionary(dictionary): Returns the words of the specified dictionary.
+    get_nltk_words(): Returns the words of the NLTK corpus, caching them on disk.
+    read_words(path): Yields the words of a dictionary file one line at a time.
     trim_dictionary(dictionary, args): Trims dictionary based on the letters on sides of the box.
-    is_word_valid(word, args): Checks if a word is valid given the letters on the sides of the box.
+    jit(function): Compiles a function with Numba when it is installed.
+    to_kernel_array(values): Converts a list of integers for the jit-compiled functions.
+    get_side_table(args): Returns a table mapping each letter to the side of the box it is on.
+    is_word_valid(word, args): Checks that a word never uses the same side twice in a row.
+    get_letter_mask(letters): Returns a bitmask with one bit set per letter.
+    index_by_first_letter(words): Groups word indices by the first letter of each word.
+    build_mask_trees(word_masks, bucket_starts, bucket_indices):
+        Builds trees of letter bitmasks over the first-letter buckets.
+    build_reach_masks(word_masks, last_letters, bucket_starts, bucket_indices, depth):
+        Builds the letters reachable by chains of words from each letter.
+    prune_dominated_words(words): Removes words whose letters are all in a similar word.
     print_solutions(all_solutions): Prints the solutions.
-    solve(args): Solves the puzzle using the given letters and dictionary.
-    recursive_solve(args, all_letters, all_search_words, search_words, all_solutions,
-                    solution, depth):
-        Recursive function to solve the puzzle using a search space and a prefix solution.
+    solve(args, dictionary=None, executor=None):
+        Solves the puzzle using the given letters and dictionary.
+    find_solutions(words, args, executor=None):
+        Finds all the solutions that can be built from the words.
+    build_search_space(words, args): Builds the arrays that the search runs on.
+    warm_up_search(args): Loads the jit-compiled search functions before forking workers.
+    search_first_words(search_space, depth, first_words):
+        Searches for the solutions starting with the given words.
+    search_solutions(search_space, path, packed_solutions):
+        Finds all the solutions starting with a given first word.
+    solve_last_word(search_space, path, missing_mask, depth, packed_solutions):
+        Finds the words that complete a solution at the last level of the search.
+    copy_to_array(values): Copies a typed list of integers into an array.
+    main(): Solves the puzzle given on the command line or the puzzles read from standard input.
 
 Copyright 2024 Arun K Viswanathan
 Licensed under the Apache License, Version 2.0 (the "License");
@@ -27,19 +50,70 @@ You may obtain a copy of the License at http://www.apache.org/licenses/LICENSE-2
 """
 
 import argparse
+import collections
+import concurrent.futures
+import contextlib
+import itertools
 import logging
 import os
+import pickle
+import re
+import sys
 import threading
 import time
 
-import nltk
-
 import constants
+from search_space import SearchSpace
+
+try:
+    import numba
+    import numpy
+except ImportError:
+    numba = None
+
+# Where the NLTK word list is cached after it is first loaded
+NLTK_CACHE_FILE = os.path.join(os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache'),
+                               'lb', 'nltk_words.pickle')
+
+# Below this many partial solutions (words ** (depth - 1)), a search is finished before worker
+# processes could start, so it runs in the current process
+MIN_PARALLEL_SEARCH_SIZE = 10**6
 
 logging.basicConfig(filename='lb.log', filemode='a', level=logging.INFO,
                     format='%(asctime)s - %(levelname)s - %(message)s')
 
 
+def jit(function):
+    """
+    Compile a function to native code with Numba when it is installed.
+
+    Parameters:
+        function (callable): The function to compile. It must only use features supported by
+        Numba's nopython mode.
+
+    Returns:
+        callable: The compiled function, or the function itself when Numba is not installed.
+    """
+    if numba is None:
+        return function
+    return numba.njit(cache=True, nogil=True)(function)
+
+
+def to_kernel_array(values):
+    """
+    Convert a list of integers to the array type passed to the jit-compiled functions.
+
+    Parameters:
+        values (list): The integers to convert.
+
+    Returns:
+        numpy.ndarray | list: An int64 array when Numba is installed, otherwise the list itself.
+    """
+    if numba is None:
+        return values
+    return numpy.asarray(values, dtype=numpy.int64)
+
+
 def parse_arguments():
     """
     Parse the command line arguments for the Letter Boxed Solver.
@@ -48,13 +122,13 @@ def parse_arguments():
         parsed_args (argparse.Namespace): The parsed command line arguments.
     """
     parser = argparse.ArgumentParser(description='Letter Boxed Solver')
-    parser.add_argument('-t', '--top', type=str, required=True,
+    parser.add_argument('-t', '--top', type=str,
                         help='Letters on the top side of the box')
-    parser.add_argument('-l', '--left', type=str, required=True,
+    parser.add_argument('-l', '--left', type=str,
                         help='Letters on the left side of the box')
-    parser.add_argument('-b', '--bottom', type=str, required=True,
+    parser.add_argument('-b', '--bottom', type=str,
                         help='Letters on the bottom side of the box')
-    parser.add_argument('-r', '--right', type=str, required=True,
+    parser.add_argument('-r', '--right', type=str,
                         help='Letters on the right side of the box')
     parser.add_argument('-m', '--min', type=int,
                         help='Minimum word length in solution (default: 4)')
@@ -64,23 +138,60 @@ def parse_arguments():
                         help='Search depth (default: 4)')
     parser.add_argument('-D', '--dict', type=str,
                         help='Dictionary file (default: /usr/share/dict/words)')
+    parser.add_argument('-j', '--jobs', type=int,
+                        help='Number of processes to search with (default: number of CPUs)')
+    parser.add_argument('-p', '--prune', action='store_true',
+                        help='Skip words whose letters are all in another word with the same '
+                             'first and last letters')
+    parser.add_argument('-i', '--interactive', action='store_true',
+                        help='Solve the puzzles read from standard input, one per line as the '
+                             'top, left, bottom and right sides separated by spaces')
     parsed_args = parser.parse_args()
-    parsed_args.top = list(str(parsed_args.top).lower())
-    parsed_args.left = list(str(parsed_args.left).lower())
-    parsed_args.bottom = list(str(parsed_args.bottom).lower())
-    parsed_args.right = list(str(parsed_args.right).lower())
-    logging.info("Puzzle letters: top=%s, left=%s, bottom=%s, right=%s",
-                 parsed_args.top, parsed_args.left, parsed_args.bottom, parsed_args.right)
+    sides = (parsed_args.top, parsed_args.left, parsed_args.bottom, parsed_args.right)
+    if not parsed_args.interactive:
+        if None in sides:
+            parser.error('the following arguments are required: -t/--top, -l/--left, '
+                         '-b/--bottom, -r/--right')
+        try:
+            set_sides(parsed_args, sides)
+        except ValueError as error:
+            parser.error(str(error))
 
     parsed_args.min = parsed_args.min or constants.MIN_WORD_LENGTH
     parsed_args.max = parsed_args.max or constants.MAX_WORD_LENGTH
     parsed_args.depth = parsed_args.depth or constants.SEARCH_DEPTH
     parsed_args.dict = parsed_args.dict or 'nltk'
-    logging.info("Search parameters: min=%s, max=%s, depth=%s, dict=%s",
-                 parsed_args.min, parsed_args.max, parsed_args.depth, parsed_args.dict)
+    parsed_args.jobs = parsed_args.jobs or os.cpu_count() or 1
+    logging.info("Search parameters: min=%s, max=%s, depth=%s, dict=%s, jobs=%s, prune=%s",
+                 parsed_args.min, parsed_args.max, parsed_args.depth, parsed_args.dict,
+                 parsed_args.jobs, parsed_args.prune)
     return parsed_args
 
 
+def set_sides(args, sides):
+    """
+    Set the letters on the sides of the box to solve for.
+
+    Parameters:
+        args (argparse.Namespace): The arguments to set the top, left, bottom and right
+        attributes of.
+        sides (iterable): The letters on the top, left, bottom and right sides of the box.
+
+    Returns:
+        None
+
+    Raises:
+        ValueError: If a side is empty or has characters other than the letters a to z.
+    """
+    sides = [side.lower() for side in sides]
+    # The letter tables and masks have one entry per letter from a to z
+    if not all(re.fullmatch('[a-z]+', side) for side in sides):
+        raise ValueError('the sides of the box must only contain the letters a to z')
+    args.top, args.left, args.bottom, args.right = sides
+    logging.info("Puzzle letters: top=%s, left=%s, bottom=%s, right=%s",
+                 args.top, args.left, args.bottom, args.right)
+
+
 def spinner(stop_event):
     """
     Generates a spinner animation while the stop_event is not set.
@@ -92,24 +203,30 @@ def spinner(stop_event):
         None
     """
     start_time = time.time()
-    while not stop_event.is_set():
-        for frame in r'-\|/':
-            elapsed_time = time.time() - start_time
-            print('\r', frame, f' {elapsed_time:.2f}s', sep='', end='', flush=True)
-            time.sleep(0.1)
+    for frame in itertools.cycle(r'-\|/'):
+        elapsed_time = time.time() - start_time
+        print('\r', frame, f' {elapsed_time:.2f}s', sep='', end='', flush=True)
+        # Sleep on the event itself so the thread stays off the GIL between frames and wakes up
+        # as soon as the search is done
+        if stop_event.wait(0.25):
+            break
 
 
 def start_spinner():
     """
-    Generate a spinner thread that runs concurrently with the main thread.
+    Generate a spinner thread that runs concurrently with the main thread, only when the output
+    is a terminal so that redirected output is not cluttered with spinner frames.
 
     Returns:
         stop_event (threading.Event): An event object to control the spinner thread.
-        spinner_thread (threading.Thread): The thread running the spinner function.
+        spinner_thread (threading.Thread): The thread running the spinner function, or None when
+        the output is not a terminal.
     """
     stop_event = threading.Event()
-    spinner_thread = threading.Thread(target=spinner, args=(stop_event,))
-    spinner_thread.start()
+    spinner_thread = None
+    if sys.stdout.isatty():
+        spinner_thread = threading.Thread(target=spinner, args=(stop_event,))
+        spinner_thread.start()
     return stop_event, spinner_thread
 
 
@@ -118,36 +235,92 @@ def stop_spinner(stop_event, spinner_thread):
     Stop the spinner thread by setting the stop event and waiting for the thread to join.
     """
     stop_event.set()
-    spinner_thread.join()
-    print()  # Print a newline to clear the spinner
+    if spinner_thread is not None:
+        spinner_thread.join()
+        print()  # Print a newline to clear the spinner
 
 
 def get_dictionary(dictionary):
     """
-    A function that retrieves a list of words from a custom dictionary file or the NLTK corpus.
+    A function that retrieves the words from a custom dictionary file or the NLTK corpus.
 
     Parameters:
     - dictionary (str): The path to the custom dictionary file.
 
     Returns:
-    - list: A list of words extracted from the custom dictionary file or the NLTK corpus.
+    - iterable: The words of the custom dictionary file, read lazily, or the list of words in the
+      NLTK corpus.
     """
     try:
-        if os.path.isfile(dictionary):
-            logging.info("Using custom dictionary: %s", dictionary)
-            with open(dictionary, 'r', encoding='utf-8') as word_file:
-                return [line.strip() for line in word_file]
-        else:
+        if not os.path.isfile(dictionary):
             raise FileNotFoundError
+        logging.info("Using custom dictionary: %s", dictionary)
+        return read_words(dictionary)
     except FileNotFoundError:
-        try:
-            nltk_words = nltk.corpus.words.words()
-        except LookupError:
-            nltk.download('words')
-            logging.info("Downloading NLTK corpus")
-            nltk_words = nltk.corpus.words.words()
-            logging.info("NLTK corpus downloaded with %s words", len(nltk_words))
-        return nltk_words
+        return get_nltk_words()
+
+
+def get_nltk_words():
+    """
+    A function that retrieves the list of words in the NLTK corpus, from the cache file when it
+    is at least as recent as the corpus files and from NLTK otherwise, caching them for the next
+    runs.
+
+    Returns:
+    - list: The list of words in the NLTK corpus.
+    """
+    try:
+        with open(NLTK_CACHE_FILE, 'rb') as cache_file:
+            corpus_times, nltk_words = pickle.load(cache_file)
+        # Checking the corpus files does not need NLTK, so a valid cache avoids importing it
+        if corpus_times and all(os.path.getmtime(path) == mtime
+                                for path, mtime in corpus_times.items()):
+            logging.info("Using cached NLTK corpus: %s", NLTK_CACHE_FILE)
+            return nltk_words
+        logging.info("NLTK corpus changed since it was cached")
+    except (OSError, EOFError, ValueError, pickle.UnpicklingError):
+        pass
+
+    # Importing NLTK takes longer than reading the cache, so only import it on a cache miss
+    import nltk  # pylint: disable=import-outside-toplevel
+    try:
+        nltk_words = nltk.corpus.words.words()
+    except LookupError:
+        nltk.download('words')
+        logging.info("Downloading NLTK corpus")
+        nltk_words = nltk.corpus.words.words()
+        logging.info("NLTK corpus downloaded with %s words", len(nltk_words))
+    # The files of a zipped corpus change with the zip file, so check the zip file instead
+    corpus_paths = {path.zipfile.filename if isinstance(path, nltk.data.ZipFilePathPointer)
+                    else str(path) for path in nltk.corpus.words.abspaths()}
+    corpus_times = {path: os.path.getmtime(path) for path in corpus_paths}
+
+    try:
+        # Write to a temporary file first so that concurrent runs never read a partial cache
+        os.makedirs(os.path.dirname(NLTK_CACHE_FILE), exist_ok=True)
+        temporary_file = f'{NLTK_CACHE_FILE}.{os.getpid()}'
+        with open(temporary_file, 'wb') as cache_file:
+            pickle.dump((corpus_times, nltk_words), cache_file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temporary_file, NLTK_CACHE_FILE)
+        logging.info("NLTK corpus cached: %s", NLTK_CACHE_FILE)
+    except OSError:
+        logging.warning("Could not cache the NLTK corpus: %s", NLTK_CACHE_FILE)
+    return nltk_words
+
+
+def read_words(path):
+    """
+    A generator that yields the words of a dictionary file one line at a time.
+
+    Parameters:
+    - path (str): The path to the dictionary file.
+
+    Yields:
+    - str: Each word of the file, stripped of surrounding whitespace.
+    """
+    with open(path, 'r', encoding='utf-8') as word_file:
+        for line in word_file:
+            yield line.strip()
 
 
 def trim_dictionary(dictionary, args):
@@ -156,62 +329,224 @@ def trim_dictionary(dictionary, args):
     the arguments.
 
     Parameters:
-        dictionary (list): A list of words to be filtered.
+        dictionary (iterable): The words to be filtered.
         args (argparse.Namespace):  The arguments passed to the function. It should have the
         following attributes:
             - min (int): The minimum length of the word.
             - max (int): The maximum length of the word.
-            - top (set): The set of letters allowed on the top side of the box.
-            - left (set): The set of letters allowed on the left side of the box.
-            - bottom (set): The set of letters allowed on the bottom side of the box.
-            - right (set): The set of letters allowed on the right side of the box.
+            - top (str): The letters allowed on the top side of the box.
+            - left (str): The letters allowed on the left side of the box.
+            - bottom (str): The letters allowed on the bottom side of the box.
+            - right (str): The letters allowed on the right side of the box.
 
     Returns:
-        list: A new list of words that meet the specified criteria.
+        list: A new list of unique words that meet the specified criteria, in dictionary order.
 
     Raises:
         None
     """
-    trimmed_dictionary = [word for word in dictionary if is_word_valid(word, args)]
+    args.side_of = get_side_table(args)
+    # A compiled regex rejects the words with letters outside the box in C as they are read, so
+    # the length and side checks only run on the few words left
+    in_box = re.compile(f'[{re.escape(args.top + args.left + args.bottom + args.right)}]+')
+    trimmed_dictionary = list(dict.fromkeys(
+        word for word in filter(in_box.fullmatch, dictionary)
+        if args.min <= len(word) <= args.max and is_word_valid(word, args)))
     logging.info("Dictionary trimmed to %s words", len(trimmed_dictionary))
     return trimmed_dictionary
 
 
+def get_side_table(args):
+    """
+    Build a lookup table mapping each letter 'a' through 'z' to the side of the box it is on.
+
+    Parameters:
+        args (argparse.Namespace): The arguments passed to the function. It should have the
+        following attributes:
+            - top (str): The letters allowed on the top side of the box.
+            - left (str): The letters allowed on the left side of the box.
+            - bottom (str): The letters allowed on the bottom side of the box.
+            - right (str): The letters allowed on the right side of the box.
+
+    Returns:
+        list: A list of 26 side numbers (0 for top, 1 for left, 2 for bottom, 3 for right)
+        indexed by letter, with -1 for letters that are not in the box.
+    """
+    side_of = [-1] * 26
+    for side_number, side in enumerate((args.top, args.left, args.bottom, args.right)):
+        for letter in side:
+            if side_of[ord(letter) - 97] == -1:
+                side_of[ord(letter) - 97] = side_number
+    return side_of
+
+
 def is_word_valid(word, args):
     """
-    Check if a given word is valid based on the specified constraints.
+    Check that a word never uses two letters from the same side of the box in a row.
+
+    The word must already be of an allowed length and made only of letters in the box, as
+    checked first by trim_dictionary.
 
     Parameters:
         word (str): The word to be checked.
         args (argparse.Namespace): The arguments passed to the function. It should have the
         following attributes:
-            - min (int): The minimum length of the word.
-            - max (int): The maximum length of the word.
-            - top (set): The set of letters allowed on the top side of the box.
-            - left (set): The set of letters allowed on the left side of the box.
-            - bottom (set): The set of letters allowed on the bottom side of the box.
-            - right (set): The set of letters allowed on the right side of the box.
+            - side_of (list): The letter to side lookup table built by get_side_table.
 
     Returns:
         bool: True if the word is valid, False otherwise.
     """
 
-    # Check if the word meets the minimum length
-    if len(word) < args.min or len(word) > args.max:
-        return False
-
-    # Check if word contains only letters in the box without consecutive letters from same side
-    sides = {'t': args.top, 'l': args.left, 'b': args.bottom, 'r': args.right}
-    prev_set_name = None
-    for letter in word:
-        set_name = next((name for name, side in sides.items() if letter in side), None)
-        if set_name is None or set_name == prev_set_name:
+    # Check that no two consecutive letters come from the same side
+    side_of = args.side_of
+    prev_side = -1
+    for code in word.encode():
+        side = side_of[code - 97]
+        if side == prev_side:
             return False
-        prev_set_name = set_name
+        prev_side = side
 
     return True
 
 
+def get_letter_mask(letters):
+    """
+    Compute a bitmask with one bit set for each letter, bit 0 for 'a' through bit 25 for 'z'.
+
+    Parameters:
+        letters (str): The lowercase letters to include in the mask.
+
+    Returns:
+        int: The bitmask of the letters.
+    """
+    mask = 0
+    for code in letters.encode():
+        mask |= 1 << (code - 97)
+    return mask
+
+
+def index_by_first_letter(words):
+    """
+    Group the indices of the given words by the first letter of each word.
+
+    Parameters:
+        words (list): The words to be indexed.
+
+    Returns:
+        bucket_starts (list): A list of 27 offsets into bucket_indices, where the indices of the
+        words starting with letter number n are bucket_indices[bucket_starts[n]:bucket_starts[n+1]].
+        bucket_indices (list): The word indices grouped by first letter, in the order the words
+        appear in the list.
+    """
+    by_first_letter = collections.defaultdict(list)
+    for index, word in enumerate(words):
+        by_first_letter[ord(word[0]) - 97].append(index)
+    bucket_starts = [0]
+    bucket_indices = []
+    for letter in range(26):
+        bucket_indices.extend(by_first_letter[letter])
+        bucket_starts.append(len(bucket_indices))
+    return bucket_starts, bucket_indices
+
+
+def build_mask_trees(word_masks, bucket_starts, bucket_indices):
+    """
+    Build a binary tree of letter bitmasks over each first-letter bucket, so that the search can
+    skip whole runs of words that cannot cover the letters still missing from a solution.
+
+    The leaves of a bucket's tree are the masks of its words in bucket order, padded with empty
+    masks to a power of two, and every other node is the union of the masks of its children.
+    When the dictionary is sorted, the words under a node share a prefix, like a trie subtree.
+
+    Parameters:
+        word_masks (list): The letter bitmask of each word.
+        bucket_starts (list): The offsets of each first-letter bucket in bucket_indices.
+        bucket_indices (list): The word indices grouped by first letter.
+
+    Returns:
+        tree_starts (list): The offsets of each bucket's tree in tree_masks. A tree with n leaves
+        has 2n slots, holding the root at index 1 and the children of node k at 2k and 2k+1.
+        tree_masks (list): The node masks of all the trees.
+    """
+    tree_starts = [0]
+    tree_masks = []
+    for bucket in range(len(bucket_starts) - 1):
+        masks = [word_masks[index]
+                 for index in bucket_indices[bucket_starts[bucket]:bucket_starts[bucket + 1]]]
+        leaves = 1 << max(len(masks) - 1, 0).bit_length()
+        tree = [0] * leaves + masks + [0] * (leaves - len(masks))
+        for node in range(leaves - 1, 0, -1):
+            tree[node] = tree[2 * node] | tree[2 * node + 1]
+        tree_masks.extend(tree)
+        tree_starts.append(len(tree_masks))
+    return tree_starts, tree_masks
+
+
+def build_reach_masks(word_masks, last_letters, bucket_starts, bucket_indices, depth):
+    """
+    Build the union of the letters of all the chains of words starting with each letter, so that
+    the search can skip the words after which the box cannot be completed in the levels left.
+
+    Parameters:
+        word_masks (list): The letter bitmask of each word.
+        last_letters (list): The letter number of the last letter of each word.
+        bucket_starts (list): The offsets of each first-letter bucket in bucket_indices.
+        bucket_indices (list): The word indices grouped by first letter.
+        depth (int): The maximum number of words in a chain.
+
+    Returns:
+        list: A list of depth * 26 masks, where reach_masks[k * 26 + n] is the union of the letters
+        of all the chains of up to k + 1 words whose first word starts with letter number n.
+    """
+    bucket_masks = [0] * 26
+    next_letters = [set() for _ in range(26)]
+    for letter in range(26):
+        for index in bucket_indices[bucket_starts[letter]:bucket_starts[letter + 1]]:
+            bucket_masks[letter] |= word_masks[index]
+            next_letters[letter].add(last_letters[index])
+    reach_masks = list(bucket_masks)
+    for _ in range(1, depth):
+        previous_masks = reach_masks[-26:]
+        for letter in range(26):
+            mask = bucket_masks[letter]
+            for next_letter in next_letters[letter]:
+                mask |= previous_masks[next_letter]
+            reach_masks.append(mask)
+    return reach_masks
+
+
+def prune_dominated_words(words):
+    """
+    Remove the words whose letters are all contained in another word with the same first and
+    last letters. Such a word can always be replaced with the other word in a solution, so every
+    puzzle that can be solved in a given number of words can still be solved after pruning, but
+    the solutions that use the removed words are no longer listed. Of the words with the same
+    letters, only the shortest one is kept.
+
+    Parameters:
+        words (list): The trimmed list of words to prune.
+
+    Returns:
+        list: The words that are not dominated by another word, in their original order.
+    """
+    groups = collections.defaultdict(dict)
+    for word in words:
+        groups[word[0], word[-1]][word] = get_letter_mask(word)
+    kept_words = set()
+    for group in groups.values():
+        kept_masks = []
+        # Visit supersets before their subsets, and the shortest of the words with the same letters
+        # first so that it is the one kept
+        for word, mask in sorted(group.items(),
+                                 key=lambda item: (-item[1].bit_count(), len(item[0]))):
+            if all(mask & kept_mask != mask for kept_mask in kept_masks):
+                kept_masks.append(mask)
+                kept_words.add(word)
+    pruned_words = [word for word in words if word in kept_words]
+    logging.info("Dictionary pruned to %s words", len(pruned_words))
+    return pruned_words
+
+
 def print_solutions(all_solutions):
     """
     A function to print the solutions in a list, with special handling for empty list cases.
@@ -224,7 +559,7 @@ def print_solutions(all_solutions):
 
 
 # Solve the puzzle using the given letters and dictionary
-def solve(args):
+def solve(args, dictionary=None, executor=None):
     """
     Solve the letter boxed puzzle using the given letters and dictionary.
 
@@ -233,49 +568,334 @@ def solve(args):
         following attributes:
             - min (int): The minimum length of the word.
             - max (int): The maximum length of the word.
-            - top (set): The set of letters allowed on the top side of the box.
-            - left (set): The set of letters allowed on the left side of the box.
-            - bottom (set): The set of letters allowed on the bottom side of the box.
-            - right (set): The set of letters allowed on the right side of the box.
+            - depth (int): The maximum number of words in a solution.
+            - prune (bool): Whether to skip words dominated by another word.
+            - top (str): The letters allowed on the top side of the box.
+            - left (str): The letters allowed on the left side of the box.
+            - bottom (str): The letters allowed on the bottom side of the box.
+            - right (str): The letters allowed on the right side of the box.
+            - dict (str): The dictionary to load when none is given.
+        dictionary (iterable): The words to solve with, to reuse a dictionary loaded once
+        across puzzles (default: the words of args.dict).
+        executor (concurrent.futures.ProcessPoolExecutor): The processes to search with, to reuse
+        them across puzzles (default: processes started for this puzzle when it needs them).
     :return: None
     """
-    dictionary = get_dictionary(args.dict)
-    args.all_search_words = args.search_words = trim_dictionary(dictionary, args)
-    args.all_letters = set(args.top + args.left + args.bottom + args.right)
+    if dictionary is None:
+        dictionary = get_dictionary(args.dict)
+    words = trim_dictionary(dictionary, args)
+    if args.prune:
+        words = prune_dominated_words(words)
     stop_event, spinner_thread = start_spinner()
-    all_solutions = recursive_solve(args, [], [])
-    stop_spinner(stop_event, spinner_thread)
+    try:
+        all_solutions = find_solutions(words, args, executor)
+    finally:
+        # Stop the spinner even when the search fails, as its thread keeps the process alive
+        stop_spinner(stop_event, spinner_thread)
     print_solutions(all_solutions)
 
 
-def recursive_solve(args, all_solutions, solution=None, depth=0):
+def find_solutions(words, args, executor=None):
     """
-    A recursive function to solve a given problem using backtracking.
+    Find all the solutions that can be built from the given words.
 
-    Args:
-        args: The arguments for the recursive solve function.
-        all_solutions: A list to store all the found solutions.
-        solution: The current solution being built (default is None).
-        depth: The current depth of recursion (default is 0).
+    Parameters:
+        words (list): The trimmed list of words to build solutions from.
+        args (argparse.Namespace): The arguments passed to the function. It should have the
+        following attributes:
+            - depth (int): The maximum number of words in a solution.
+            - jobs (int): The number of processes to search with, when the search is large.
+            - top (str): The letters allowed on the top side of the box.
+            - left (str): The letters allowed on the left side of the box.
+            - bottom (str): The letters allowed on the bottom side of the box.
+            - right (str): The letters allowed on the right side of the box.
+        executor (concurrent.futures.ProcessPoolExecutor): The processes to search with (default:
+        args.jobs processes started for this search when it is large).
 
     Returns:
-        list: A list of all the found solutions.
-    """
-    solution = solution or []
-    if depth != args.depth:
-        for word in args.search_words:
-            potential_solution = solution + [word]
-            used_letters = set(list(''.join(potential_solution)))
-            if args.all_letters == used_letters:
-                logging.info("Found solution: %s", potential_solution)
-                all_solutions.append(potential_solution)
-            else:
-                last_letter = word[-1]
-                args.search_words = [x for x in args.all_search_words
-                                     if x[0] == last_letter and x != word]
-                all_solutions = recursive_solve(args, all_solutions, potential_solution, depth + 1)
+        list: A list of all the found solutions, each a list of words.
+    """
+    search_space = build_search_space(words, args)
+    if args.jobs > 1 and len(words) ** (args.depth - 1) >= MIN_PARALLEL_SEARCH_SIZE:
+        # Split the first words into more chunks than processes to balance the load
+        chunk_size = -(-len(words) // (args.jobs * 8)) or 1
+        chunks = [range(start, min(start + chunk_size, len(words)))
+                  for start in range(0, len(words), chunk_size)]
+        warm_up_search(args)
+        # Unlike a multiprocessing.Pool, the executor raises BrokenProcessPool when a worker dies
+        # instead of waiting forever for its results
+        with (contextlib.nullcontext(executor) if executor
+              else concurrent.futures.ProcessPoolExecutor(args.jobs)) as pool:
+            packed_solutions = list(itertools.chain.from_iterable(pool.map(
+                search_first_words, itertools.repeat(search_space), itertools.repeat(args.depth),
+                chunks)))
+    else:
+        packed_solutions = search_first_words(search_space, args.depth, range(len(words)))
+
+    # Unpack each row of args.depth word indices into a list of words
+    all_solutions = [[words[index] for index in row if index >= 0]
+                     for row in zip(*[iter(packed_solutions)] * args.depth)]
+    for solution in all_solutions:
+        logging.info("Found solution: %s", solution)
     return all_solutions
 
 
+def build_search_space(words, args):
+    """
+    Build the arrays describing the given words and the letters in the box that the search runs
+    on.
+
+    Parameters:
+        words (list): The trimmed list of words to build solutions from.
+        args (argparse.Namespace): The arguments passed to the function. It should have the
+        following attributes:
+            - depth (int): The maximum number of words in a solution.
+            - top (str): The letters allowed on the top side of the box.
+            - left (str): The letters allowed on the left side of the box.
+            - bottom (str): The letters allowed on the bottom side of the box.
+            - right (str): The letters allowed on the right side of the box.
+
+    Returns:
+        SearchSpace: The search space, as described in search_solutions.
+    """
+    word_masks = [get_letter_mask(word) for word in words]
+    last_letters = [ord(word[-1]) - 97 for word in words]
+    bucket_starts, bucket_indices = index_by_first_letter(words)
+    tree_starts, tree_masks = build_mask_trees(word_masks, bucket_starts, bucket_indices)
+    reach_masks = build_reach_masks(word_masks, last_letters, bucket_starts, bucket_indices,
+                                    args.depth)
+    return SearchSpace(
+        word_masks=to_kernel_array(word_masks),
+        last_letters=to_kernel_array(last_letters),
+        bucket_starts=to_kernel_array(bucket_starts),
+        bucket_indices=to_kernel_array(bucket_indices),
+        tree_starts=to_kernel_array(tree_starts),
+        tree_masks=to_kernel_array(tree_masks),
+        reach_masks=to_kernel_array(reach_masks),
+        target_mask=get_letter_mask(args.top + args.left + args.bottom + args.right))
+
+
+def warm_up_search(args):
+    """
+    Load the jit-compiled search functions in the current process by searching a one-word
+    dictionary. The worker processes forked from it then start with the functions ready, instead
+    of each loading them from the Numba cache on its first call.
+
+    Parameters:
+        args (argparse.Namespace): The arguments passed to the function, with the attributes
+        described in build_search_space.
+
+    Returns:
+        None
+    """
+    if numba is None or args.depth < 2:
+        return
+    path = numpy.full(args.depth, -1, dtype=numpy.int64)
+    path[0] = 0
+    packed_solutions = numba.typed.List.empty_list(numba.types.int64)
+    packed_solutions.extend(path)
+    search_solutions(build_search_space(['aa'], args), path, packed_solutions)
+    copy_to_array(packed_solutions)
+
+
+def search_first_words(search_space, depth, first_words):
+    """
+    Search for all the solutions starting with the given first words. The first words are
+    independent, so they can be searched in parallel.
+
+    Parameters:
+        search_space (SearchSpace): The arrays describing the words and the target letters, as
+        described in search_solutions.
+        depth (int): The maximum number of words in a solution.
+        first_words (range): The indices of the first words to search from.
+
+    Returns:
+        list: The found solutions, each stored as depth word indices padded with -1.
+    """
+    word_masks = search_space.word_masks
+    last_letters = search_space.last_letters
+    reach_masks = search_space.reach_masks
+    target_mask = search_space.target_mask
+    reach_offset = (depth - 2) * 26
+    if numba is None:
+        path = [-1] * depth
+        packed_solutions = []
+    else:
+        path = numpy.full(depth, -1, dtype=numpy.int64)
+        packed_solutions = numba.typed.List.empty_list(numba.types.int64)
+    for index in first_words:
+        path[0] = index
+        if word_masks[index] == target_mask:
+            packed_solutions.extend(path)
+        elif len(path) > 1 and \
+                word_masks[index] | reach_masks[reach_offset + last_letters[index]] == target_mask:
+            search_solutions(search_space, path, packed_solutions)
+    if numba is not None:
+        # Reading a typed list from Python is slow, so copy it into an array from native code
+        packed_solutions = copy_to_array(packed_solutions).tolist()
+    return packed_solutions
+
+
+@jit
+def search_solutions(search_space, path, packed_solutions):
+    """
+    Find all the solutions starting with the first word of the path, walking the search tree
+    depth first with an explicit stack instead of recursion.
+
+    Args:
+        search_space: A SearchSpace of the arrays describing the words and the target letters:
+            - word_masks: The letter bitmask of each word.
+            - last_letters: The letter number of the last letter of each word.
+            - bucket_starts: The offsets of each first-letter bucket in bucket_indices.
+            - bucket_indices: The word indices grouped by first letter.
+            - tree_starts: The offsets of each bucket's tree in tree_masks.
+            - tree_masks: The letter bitmask trees built by build_mask_trees.
+            - reach_masks: The letters reachable from each letter built by build_reach_masks.
+            - target_mask: The bitmask of all the letters in the box.
+        path: The word indices of the current solution, one slot per level of the search, with
+            the first word set and -1 in all the other slots. The slots are reset to -1 on
+            return.
+        packed_solutions: A list to store all the found solutions, each stored as len(path)
+            word indices padded with -1.
+
+    Returns:
+        None
+    """
+    word_masks = search_space.word_masks
+    last_letters = search_space.last_letters
+    bucket_starts = search_space.bucket_starts
+    bucket_indices = search_space.bucket_indices
+    reach_masks = search_space.reach_masks
+    target_mask = search_space.target_mask
+    # The stack holds, for each level, the letters used by the words before it and the position
+    # of the next word to try in its first-letter bucket
+    used_masks = [0] * len(path)
+    positions = [0] * len(path)
+    used_masks[1] = word_masks[path[0]]
+    positions[1] = bucket_starts[last_letters[path[0]]]
+    depth = 1
+    while depth > 0:
+        if depth + 1 == len(path):
+            solve_last_word(search_space, path, target_mask & ~used_masks[depth], depth,
+                            packed_solutions)
+            path[depth] = -1
+            depth -= 1
+            continue
+        # Scan the rest of the bucket until a word needs to be extended by another level
+        position = positions[depth]
+        end = bucket_starts[last_letters[path[depth - 1]] + 1]
+        while position < end:
+            index = bucket_indices[position]
+            position += 1
+            if index == path[depth - 1]:
+                continue
+            # Stage the letters used with this word in the next level, to descend into it unless
+            # it completes a solution or no chain of words after it can complete one
+            used_masks[depth + 1] = used_masks[depth] | word_masks[index]
+            path[depth] = index
+            if used_masks[depth + 1] == target_mask:
+                packed_solutions.extend(path)
+            elif used_masks[depth + 1] | \
+                    reach_masks[(len(path) - depth - 2) * 26 + last_letters[index]] == target_mask:
+                break
+        else:
+            path[depth] = -1
+            depth -= 1
+            continue
+        positions[depth] = position
+        depth += 1
+        positions[depth] = bucket_starts[last_letters[index]]
+
+
+@jit
+def solve_last_word(search_space, path, missing_mask, depth, packed_solutions):
+    """
+    Find the words that complete the current solution at the last level of the search, walking
+    the bucket's mask tree and skipping the subtrees that cannot cover all the missing letters.
+
+    Args:
+        search_space: The SearchSpace of arrays describing the words and the target letters, as
+            described in search_solutions.
+        path: The word indices of the current solution, as described in search_solutions.
+        missing_mask: The bitmask of letters not yet used by the current solution.
+        depth: The current depth of the search, which is the last one.
+        packed_solutions: A list to store all the found solutions, each stored as len(path)
+            word indices padded with -1.
+
+    Returns:
+        None
+    """
+    bucket_indices = search_space.bucket_indices
+    tree_starts = search_space.tree_starts
+    tree_masks = search_space.tree_masks
+    last_letter = search_space.last_letters[path[depth - 1]]
+    bucket_start = search_space.bucket_starts[last_letter]
+    tree_start = tree_starts[last_letter]
+    leaves = (tree_starts[last_letter + 1] - tree_start) // 2
+    node = 1
+    while node > 0:
+        if tree_masks[tree_start + node] & missing_mask == missing_mask:
+            if node < leaves:
+                node *= 2
+                continue
+            index = bucket_indices[bucket_start + node - leaves]
+            if index != path[depth - 1]:
+                path[depth] = index
+                packed_solutions.extend(path)
+        # Move on to the next subtree in bucket order: climb while on a right child, then step
+        # over to the right sibling, ending when climbing past the root
+        while node & 1:
+            node >>= 1
+        if node > 0:
+            node += 1
+
+
+@jit
+def copy_to_array(values):
+    """
+    Copy a typed list of integers into an array.
+
+    Args:
+        values: The typed list to copy.
+
+    Returns:
+        numpy.ndarray: An int64 array of the values.
+    """
+    array = numpy.empty(len(values), dtype=numpy.int64)
+    for position, value in enumerate(values):
+        array[position] = value
+    return array
+
+
+def main():
+    """
+    Solve the puzzle given on the command line, or in interactive mode every puzzle read from
+    standard input, loading the dictionary only once.
+
+    Returns:
+        None
+    """
+    args = parse_arguments()
+    if not args.interactive:
+        solve(args)
+        return
+    dictionary = list(get_dictionary(args.dict))
+    # The worker processes start on the first large search and are reused for the next puzzles
+    with concurrent.futures.ProcessPoolExecutor(args.jobs) as executor:
+        for line in sys.stdin:
+            sides = line.split()
+            if not sides:
+                continue
+            if len(sides) != 4:
+                print("Expected the top, left, bottom and right sides separated by spaces")
+                continue
+            try:
+                set_sides(args, sides)
+            except ValueError:
+                print("Expected the top, left, bottom and right sides with only the letters a to z")
+                continue
+            solve(args, dictionary, executor)
+
+
 if __name__ == '__main__':
-    solve(parse_arguments())
+    main()
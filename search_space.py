@@ -0,0 +1,18 @@
+"""
+This module defines the search space that the solver searches for solutions in.
+
+It lives in its own module rather than in lb.py so that the type has the same identity in every
+run, which the Numba cache needs to match the signatures of the compiled search functions when
+lb.py is run as a script.
+Copyright 2024 Arun K Viswanathan
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at http://www.apache.org/licenses/LICENSE-2.0
+"""
+
+import collections
+
+# The arrays describing the words and the target letters, as described in lb.search_solutions
+SearchSpace = collections.namedtuple('SearchSpace', [
+    'word_masks', 'last_letters', 'bucket_starts', 'bucket_indices', 'tree_starts', 'tree_masks',
+    'reach_masks', 'target_mask'])